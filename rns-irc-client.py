@@ -8,13 +8,17 @@ connections and bridges each one over a separate RNS Link to the server bridge.
 
 import os
 import sys
+import errno
+import struct
 import time
 import signal
 import socket
+import asyncio
+import collections
 import threading
 import argparse
+from contextlib import suppress
 
-import yaml
 import RNS
 
 APP_NAME = "irc"
@@ -26,8 +30,122 @@ DEFAULT_CONFIG = {
     "listen_port": 6667,
     "rns_configdir": None,
     "path_request_timeout": 30,
+    "batch_bytes": 1024,
+    "batch_ms": 10,
+    "max_clients": 64,
 }
 
+# Socket tuning for bulk (DCC) transfers and interactive latency
+RECV_CHUNK = 65536
+SOCK_BUF_SIZE = 1 << 20
+
+# Seconds between retries while the RNS channel window is full
+WINDOW_RETRY = 0.05
+
+# Seconds a closing connection may spend sending queued data over its link
+LINK_DRAIN_TIMEOUT = 15
+
+# Stop reading from RNS while this much is waiting for a slow TCP peer
+TXBUF_HIGH_WATER = 256 * 1024
+
+# Seconds to wait for an RNS Link to the server to be established
+LINK_TIMEOUT = 30
+
+# Seconds to stop accepting while the process is out of file descriptors
+ACCEPT_BACKOFF = 1.0
+
+# Seconds to reuse a recalled server identity/destination between clients
+DEST_CACHE_TTL = 60
+
+# MSG_ZEROCOPY (Linux 4.14+) for large RNS->TCP writes; constants from
+# <linux/socket.h> and <linux/errqueue.h> where Python doesn't expose them
+SO_ZEROCOPY = getattr(socket, "SO_ZEROCOPY", 60)
+MSG_ZEROCOPY = getattr(socket, "MSG_ZEROCOPY", 0x4000000)
+SO_EE_ORIGIN_ZEROCOPY = 5
+SO_EE_CODE_ZEROCOPY_COPIED = 1
+_SOCK_EXTENDED_ERR = struct.Struct("=IBBBBII")
+# Below this, page pinning and completion handling cost more than the copy
+ZEROCOPY_MIN_BYTES = 10240
+
+
+def _tune_socket(sock):
+    """Disable Nagle and enlarge kernel buffers on a bridged TCP socket."""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF_SIZE)
+
+
+class ZerocopySender:
+    """Sends large payloads with MSG_ZEROCOPY on Linux, falling back to send().
+
+    The kernel pins the pages of a zerocopy send instead of copying them, so
+    each payload is kept alive until its completion is reaped from the
+    socket's error queue.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.enabled = sys.platform.startswith("linux") and sock.family != socket.AF_UNIX
+        if self.enabled:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_ZEROCOPY, 1)
+            except OSError:
+                self.enabled = False
+        self._next_id = 0
+        self._inflight = collections.deque()  # (send id, payload)
+
+    def send(self, data):
+        """Send what the socket will take of data; return the byte count."""
+        if not self.enabled or len(data) < ZEROCOPY_MIN_BYTES:
+            return self.sock.send(data)
+        try:
+            sent = self.sock.sendmsg([data], [], MSG_ZEROCOPY)
+        except OSError as e:
+            if e.errno != errno.ENOBUFS:
+                raise
+            # Out of pinnable memory; copy this one
+            return self.sock.send(data)
+        self._inflight.append((self._next_id, data))
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        return sent
+
+    def reap(self):
+        """Release payloads whose zerocopy sends the kernel has completed."""
+        while self._inflight:
+            try:
+                _, ancdata, _, _ = self.sock.recvmsg(0, 256, socket.MSG_ERRQUEUE)
+            except OSError:
+                return
+            for _, _, cdata in ancdata:
+                if len(cdata) < _SOCK_EXTENDED_ERR.size:
+                    continue
+                _, origin, _, code, _, _, last = _SOCK_EXTENDED_ERR.unpack_from(cdata)
+                if origin != SO_EE_ORIGIN_ZEROCOPY:
+                    continue
+                # Completions cover the id range [first, last]; ids wrap at 2**32
+                while self._inflight and (last - self._inflight[0][0]) & 0xFFFFFFFF < 0x80000000:
+                    self._inflight.popleft()
+                if code & SO_EE_CODE_ZEROCOPY_COPIED:
+                    # The kernel copied anyway (e.g. loopback): pinning only costs us
+                    self.enabled = False
+
+
+class ServerAnnounceHandler:
+    """Wakes the path wait as soon as the server's announce or path response arrives."""
+
+    aspect_filter = f"{APP_NAME}.{ASPECT}"
+    # Only honoured by newer RNS; older releases (e.g. 0.7.0) never pass path
+    # responses to announce handlers, so there the 0.5 s has_path() poll wakes us
+    receive_path_responses = True
+
+    def __init__(self, dest_hash, event):
+        self.dest_hash = dest_hash
+        self.event = event
+
+    def received_announce(self, destination_hash, announced_identity, app_data):
+        if destination_hash == self.dest_hash:
+            self.event.set()
+
 
 class IRCClientBridge:
     def __init__(self, config_path=None, dest_hash_override=None):
@@ -44,13 +162,29 @@ class IRCClientBridge:
         self.reticulum = None
         self.server_dest_hash = None
         self.listen_sock = None
-        self.clients = []
-        self.clients_lock = threading.Lock()
+        self.loop = None
+        # Only touched on the event loop thread, so no lock is needed
+        self.clients = {}  # link hash -> ClientBridgedConnection
+        # One slot per client from accept until its link is gone
+        self._client_slots = threading.BoundedSemaphore(self.config["max_clients"])
         self.running = False
+        self._path_event = threading.Event()
+        self._dest_cache = None
+        self._dest_cache_ts = 0
 
     def _load_config(self, path):
-        with open(path, "r") as f:
-            data = yaml.safe_load(f)
+        # Parsers are imported lazily so a TOML config doesn't need PyYAML
+        if path.endswith(".toml"):
+            import tomllib
+
+            with open(path, "rb") as f:
+                data = tomllib.load(f)
+        else:
+            import yaml
+
+            loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+            with open(path, "r") as f:
+                data = yaml.load(f, Loader=loader)
         return data.get("client", {})
 
     def start(self):
@@ -76,17 +210,25 @@ class IRCClientBridge:
         # Request path to server if we don't have one
         if not RNS.Transport.has_path(self.server_dest_hash):
             RNS.log("Requesting path to server...", RNS.LOG_INFO)
+            handler = ServerAnnounceHandler(self.server_dest_hash, self._path_event)
+            RNS.Transport.register_announce_handler(handler)
             RNS.Transport.request_path(self.server_dest_hash)
-            timeout = self.config.get("path_request_timeout", 30)
-            start = time.time()
-            while not RNS.Transport.has_path(self.server_dest_hash):
-                time.sleep(0.5)
-                if time.time() - start > timeout:
-                    RNS.log(
-                        "Timed out waiting for path to server. Is the server running and announced?",
-                        RNS.LOG_ERROR,
-                    )
-                    sys.exit(1)
+            deadline = time.monotonic() + self.config.get("path_request_timeout", 30)
+            try:
+                while not RNS.Transport.has_path(self.server_dest_hash):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        RNS.log(
+                            "Timed out waiting for path to server. Is the server running and announced?",
+                            RNS.LOG_ERROR,
+                        )
+                        sys.exit(1)
+                    if self._path_event.wait(min(remaining, 0.5)):
+                        self._path_event.clear()
+                    if not self.running:
+                        return
+            finally:
+                RNS.Transport.deregister_announce_handler(handler)
 
         RNS.log("Path to server found", RNS.LOG_INFO)
 
@@ -96,8 +238,18 @@ class IRCClientBridge:
         self.listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.listen_sock.bind((listen_host, listen_port))
-        self.listen_sock.listen(5)
-        self.listen_sock.settimeout(1.0)
+        # IRC clients speak first, so on Linux TCP_DEFER_ACCEPT delays
+        # accept() until the first bytes arrive or the defer timeout passes
+        if hasattr(socket, "TCP_DEFER_ACCEPT"):
+            self.listen_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT, 1)
+        self.listen_sock.listen(socket.SOMAXCONN)
+        self.listen_sock.setblocking(False)
+
+        # One event loop drives the listen socket, every client socket and
+        # (via call_soon_threadsafe) every RNS callback
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.add_reader(self.listen_sock, self._on_accept)
 
         RNS.log(
             f"IRC Client Bridge listening on {listen_host}:{listen_port}",
@@ -109,126 +261,225 @@ class IRCClientBridge:
         )
         RNS.log("Connect your IRC client to this address", RNS.LOG_INFO)
 
-        # Accept loop
         try:
-            while self.running:
-                try:
-                    client_sock, addr = self.listen_sock.accept()
-                    RNS.log(f"IRC client connected from {addr}", RNS.LOG_INFO)
-                    handler = threading.Thread(
-                        target=self._handle_client,
-                        args=(client_sock, addr),
-                        daemon=True,
-                    )
-                    handler.start()
-                except socket.timeout:
-                    continue
+            self.loop.run_forever()
         except KeyboardInterrupt:
             pass
         finally:
             self.shutdown()
 
-    def _handle_client(self, client_sock, addr):
-        """Handle a single IRC client connection by establishing an RNS Link."""
+    def _on_accept(self):
+        """Accept every pending IRC client on the listen socket."""
+        while True:
+            try:
+                client_sock, addr = self.listen_sock.accept()
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno in (errno.ECONNABORTED, errno.EPROTO):
+                    # Only that one connection is lost; keep accepting
+                    RNS.log(f"Failed to accept IRC client: {e}", RNS.LOG_WARNING)
+                    continue
+                # The listen socket stays readable while the connection is
+                # queued, so back off instead of failing on every wakeup
+                RNS.log(
+                    f"Cannot accept IRC clients: {e}; retrying in {ACCEPT_BACKOFF}s",
+                    RNS.LOG_ERROR,
+                )
+                self.loop.remove_reader(self.listen_sock)
+                self.loop.call_later(ACCEPT_BACKOFF, self._resume_accept)
+                return
+            if not self._client_slots.acquire(blocking=False):
+                RNS.log(
+                    f"Rejecting IRC client {addr}: max_clients ({self.config['max_clients']}) reached",
+                    RNS.LOG_WARNING,
+                )
+                client_sock.close()
+                continue
+            try:
+                _tune_socket(client_sock)
+            except OSError as e:
+                RNS.log(f"Failed to set up IRC client {addr}: {e}", RNS.LOG_ERROR)
+                client_sock.close()
+                self._client_slots.release()
+                continue
+            RNS.log(f"IRC client connected from {addr}", RNS.LOG_INFO)
+            self.loop.create_task(self._handle_client(client_sock, addr))
+
+    def _resume_accept(self):
+        if self.running:
+            self.loop.add_reader(self.listen_sock, self._on_accept)
+
+    def _server_destination(self):
+        """Return the server's OUT destination, cached for DEST_CACHE_TTL seconds."""
+        if self._dest_cache and time.monotonic() - self._dest_cache_ts < DEST_CACHE_TTL:
+            return self._dest_cache
+
         # Recall the server identity
         server_identity = RNS.Identity.recall(self.server_dest_hash)
         if not server_identity:
-            RNS.log("Cannot recall server identity. Try again after an announce.", RNS.LOG_ERROR)
-            client_sock.close()
-            return
+            return None
 
         # Build the server destination
-        server_destination = RNS.Destination(
+        self._dest_cache = RNS.Destination(
             server_identity,
             RNS.Destination.OUT,
             RNS.Destination.SINGLE,
             APP_NAME,
             ASPECT,
         )
+        self._dest_cache_ts = time.monotonic()
+        return self._dest_cache
 
-        # Establish RNS Link
-        link = RNS.Link(server_destination)
+    async def _handle_client(self, client_sock, addr):
+        """Handle a single IRC client connection by establishing an RNS Link."""
+        server_destination = self._server_destination()
+        if not server_destination:
+            RNS.log("Cannot recall server identity. Try again after an announce.", RNS.LOG_ERROR)
+            client_sock.close()
+            self._client_slots.release()
+            return
 
-        conn = ClientBridgedConnection(link, client_sock, addr)
+        # Nothing awaits this task, so failures here must be cleaned up
+        # locally or the socket and its max_clients slot would leak
+        link = None
+        try:
+            # Establish RNS Link
+            link = RNS.Link(server_destination)
+
+            conn = ClientBridgedConnection(
+                link,
+                client_sock,
+                addr,
+                self.loop,
+                self.config["batch_bytes"],
+                self.config["batch_ms"],
+            )
 
-        with self.clients_lock:
-            self.clients.append(conn)
+            self.clients[link.hash] = conn
 
-        # Set callbacks
-        link.set_link_established_callback(conn.link_established)
-        link.set_link_closed_callback(conn.link_closed)
+            # Set callbacks
+            link.set_link_established_callback(conn.link_established)
+            link.set_link_closed_callback(self._link_closed)
+        except Exception as e:
+            RNS.log(f"Failed to open RNS Link for {addr}: {e}", RNS.LOG_ERROR)
+            if link:
+                self.clients.pop(link.hash, None)
+            self._client_slots.release()
+            with suppress(OSError):
+                client_sock.close()
+            if link:
+                with suppress(Exception):
+                    link.teardown()
+            return
 
         # Wait for link establishment or timeout
-        timeout = 30
-        start = time.time()
-        while not conn.is_ready() and not conn.is_failed() and time.time() - start < timeout:
-            time.sleep(0.1)
-
-        if not conn.is_ready():
+        if not await conn.wait_ready(LINK_TIMEOUT):
             RNS.log(f"Link establishment timed out for {addr}", RNS.LOG_ERROR)
+            self._dest_cache = None
+            if self.clients.pop(link.hash, None):
+                self._client_slots.release()
             conn.stop()
-            with self.clients_lock:
-                if conn in self.clients:
-                    self.clients.remove(conn)
+
+    def _link_closed(self, link):
+        """Called from an RNS thread; hands off to the event loop."""
+        self.loop.call_soon_threadsafe(self._on_link_closed, link)
+
+    def _on_link_closed(self, link):
+        conn = self.clients.pop(link.hash, None)
+        if conn:
+            self._client_slots.release()
+            conn.link_closed(link)
 
     def shutdown(self):
         RNS.log("Shutting down client bridge...", RNS.LOG_INFO)
         self.running = False
+        self._path_event.set()
 
         if self.listen_sock:
-            try:
+            if self.loop:
+                with suppress(ValueError):
+                    self.loop.remove_reader(self.listen_sock)
+            with suppress(OSError):
                 self.listen_sock.close()
-            except Exception:
-                pass
 
-        with self.clients_lock:
-            for conn in list(self.clients):
-                conn.stop()
-            self.clients.clear()
+        clients = list(self.clients.values())
+        self.clients.clear()
+        for conn in clients:
+            conn.stop()
+
+        if self.loop:
+            self.loop.stop()
 
 
 class ClientBridgedConnection:
-    """Bridges a single local TCP IRC client <-> RNS Link to the server."""
+    """Bridges a single local TCP IRC client <-> RNS Link to the server.
+
+    Everything runs on the bridge's event loop; the RNS callbacks
+    (link_established, _rns_data_ready) only schedule work onto it.
+    """
 
     BUFFER_STREAM_ID = 0
 
-    def __init__(self, link, tcp_sock, addr):
+    def __init__(self, link, tcp_sock, addr, loop, batch_bytes, batch_ms):
         self.link = link
         self.tcp_sock = tcp_sock
         self.addr = addr
-        self.buffer = None
+        self.loop = loop
+        self.reader = None
+        self.writer = None
         self.channel = None
+        self._rxbuf = bytearray(RECV_CHUNK)
+        self._rxview = memoryview(self._rxbuf)
+        self._txbuf = bytearray()
+        self._rns_ready = 0
+        self._rnsq = bytearray()
+        self._reading = False
+        self._zerocopy = ZerocopySender(tcp_sock)
+        self.batch_bytes = batch_bytes
+        self.batch_delay = batch_ms / 1000.0
+        self._flush_handle = None
         self.running = True
-        self._ready = False
-        self._failed = False
-        self.tcp_to_rns_thread = None
-        self._buffer_lock = threading.Lock()
+        # Resolved by link_established or link_closed, whichever comes first
+        self._ready = loop.create_future()
 
-    def is_ready(self):
-        return self._ready
+    async def wait_ready(self, timeout):
+        """Wait until the link is established or has failed; True if it is up."""
+        try:
+            return await asyncio.wait_for(self._ready, timeout)
+        except asyncio.TimeoutError:
+            return False
 
-    def is_failed(self):
-        return self._failed
+    def _resolve_ready(self, ready):
+        if not self._ready.done():
+            self._ready.set_result(ready)
 
     def link_established(self, link):
-        """Called when the RNS Link is ready."""
+        """Called from an RNS thread when the RNS Link is ready."""
+        self.loop.call_soon_threadsafe(self._on_link_established, link)
+
+    def _on_link_established(self, link):
+        if not self.running:
+            # The client gave up waiting; don't leave the link open server-side
+            link.teardown()
+            return
+
         RNS.log(f"RNS Link established for {self.addr}", RNS.LOG_INFO)
 
         self.channel = link.get_channel()
-        self.buffer = RNS.Buffer.create_bidirectional_buffer(
-            self.BUFFER_STREAM_ID,
+        self.reader = RNS.Buffer.create_reader(
             self.BUFFER_STREAM_ID,
             self.channel,
             self._rns_data_ready,
         )
+        # Raw writer: the buffered one spins while the channel window is full
+        self.writer = RNS.RawChannelWriter(self.BUFFER_STREAM_ID, self.channel)
 
-        # Start TCP->RNS forwarding thread
-        self.tcp_to_rns_thread = threading.Thread(
-            target=self._tcp_to_rns_loop, daemon=True
-        )
-        self.tcp_to_rns_thread.start()
+        # Hand the TCP side to the event loop for TCP->RNS forwarding
+        self.tcp_sock.setblocking(False)
+        self._set_reading(True)
 
-        self._ready = True
+        self._resolve_ready(True)
 
     def link_closed(self, link):
         """Called when the RNS Link is torn down."""
@@ -240,63 +491,182 @@ class ClientBridgedConnection:
         elif link.teardown_reason == RNS.Link.INITIATOR_CLOSED:
             reason = "client closed"
         RNS.log(f"RNS Link closed for {self.addr}: {reason}", RNS.LOG_INFO)
-        self._failed = True
+        self._resolve_ready(False)
         self.stop()
 
     def _rns_data_ready(self, ready_bytes):
-        """Called when RNS buffer has data from the IRC server."""
+        """Called from an RNS thread when the buffer has data from the IRC server."""
+        self.loop.call_soon_threadsafe(self._forward_to_tcp, ready_bytes)
+
+    def _forward_to_tcp(self, ready_bytes):
         if not self.running:
             return
+        if len(self._txbuf) >= TXBUF_HIGH_WATER:
+            # The TCP peer isn't keeping up: leave the data in the RNS
+            # reader until _on_tcp_writable has drained _txbuf
+            self._rns_ready = ready_bytes
+            return
         try:
-            with self._buffer_lock:
-                data = self.buffer.read(ready_bytes)
+            data = self.reader.read(ready_bytes)
             if data:
-                self.tcp_sock.sendall(data)
+                self._send(data)
         except Exception as e:
             RNS.log(f"Error forwarding RNS->TCP for {self.addr}: {e}", RNS.LOG_ERROR)
             self.stop()
 
-    def _tcp_to_rns_loop(self):
-        """Read from local IRC client and write to RNS buffer."""
+    def _send(self, data):
+        """Write to the TCP socket, queueing whatever it can't take yet."""
+        if self._txbuf:
+            self._txbuf += data
+            return
+        self._zerocopy.reap()
+        try:
+            sent = self._zerocopy.send(data)
+        except BlockingIOError:
+            sent = 0
+        if sent < len(data):
+            self._txbuf += memoryview(data)[sent:]
+            self.loop.add_writer(self.tcp_sock, self._on_tcp_writable)
+
+    def _on_tcp_writable(self):
+        self._zerocopy.reap()
+        try:
+            sent = self.tcp_sock.send(self._txbuf)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            RNS.log(f"Error forwarding RNS->TCP for {self.addr}: {e}", RNS.LOG_ERROR)
+            self.stop()
+            return
+        del self._txbuf[:sent]
+        if not self._txbuf:
+            self.loop.remove_writer(self.tcp_sock)
+            if self._rns_ready:
+                ready_bytes, self._rns_ready = self._rns_ready, 0
+                self._forward_to_tcp(ready_bytes)
+
+    def _set_reading(self, reading):
+        """Start or stop polling the TCP socket for TCP->RNS data."""
+        if reading == self._reading:
+            return
+        self._reading = reading
+        if reading:
+            self.loop.add_reader(self.tcp_sock, self._on_tcp_readable)
+        else:
+            self.loop.remove_reader(self.tcp_sock)
+
+    def _write(self, data):
+        """Queue TCP data for the RNS Link, flushing once a batch is full."""
+        self._rnsq += data
+        if len(self._rnsq) >= self.batch_bytes or self.batch_delay <= 0:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.batch_delay, self.flush)
+
+    def flush(self):
+        """Send queued TCP data over the RNS Link, as far as the channel window allows.
+
+        RNS returns 0 from a write while the window is full rather than
+        blocking, so packets are only handed over while the channel is
+        ready. The rest stays queued with the TCP reader paused, so
+        backpressure reaches the sender, and is retried shortly.
+        """
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self.running:
+            return
         try:
-            while self.running:
-                data = self.tcp_sock.recv(4096)
-                if not data:
-                    RNS.log(f"IRC client {self.addr} disconnected", RNS.LOG_INFO)
+            while self._rnsq and self.channel.is_ready_to_send():
+                sent = self.writer.write(self._rnsq)
+                if not sent:
                     break
-                with self._buffer_lock:
-                    self.buffer.write(data)
-                    self.buffer.flush()
+                del self._rnsq[:sent]
         except Exception as e:
-            if self.running:
-                RNS.log(f"Error in TCP->RNS loop for {self.addr}: {e}", RNS.LOG_ERROR)
-        finally:
+            RNS.log(f"Error in TCP->RNS forwarding for {self.addr}: {e}", RNS.LOG_ERROR)
             self.stop()
+            return
+        if self._rnsq:
+            self._set_reading(False)
+            self._flush_handle = self.loop.call_later(WINDOW_RETRY, self.flush)
+        else:
+            self._set_reading(True)
+
+    def _on_tcp_readable(self):
+        """Read once from the local IRC client socket and queue it for the RNS Link."""
+        if not self.running:
+            return
+        # Zerocopy completions raise POLLERR, which also wakes this callback
+        self._zerocopy.reap()
+        try:
+            # One read per wakeup: flush() only hands RNS what its window
+            # will take, so anything more is better left in the kernel
+            # socket buffer, where it pushes back on the sender.
+            try:
+                n = self.tcp_sock.recv_into(self._rxview)
+            except BlockingIOError:
+                return
+            if n:
+                self._write(self._rxview[:n])
+                return
+            RNS.log(f"IRC client {self.addr} disconnected", RNS.LOG_INFO)
+        except Exception as e:
+            if self.running:
+                RNS.log(f"Error in TCP->RNS forwarding for {self.addr}: {e}", RNS.LOG_ERROR)
+        self.stop()
 
     def stop(self):
         if not self.running:
             return
         self.running = False
 
-        try:
-            self.tcp_sock.close()
-        except Exception:
-            pass
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
 
-        try:
-            if self.buffer:
-                self.buffer.close()
-        except Exception:
-            pass
+        # Stop polling first, then hand the link to an executor thread:
+        # sending the queued data and EOF waits on the channel window,
+        # which would stall every other connection on the event loop.
+        with suppress(ValueError):
+            self.loop.remove_reader(self.tcp_sock)
+            self.loop.remove_writer(self.tcp_sock)
+        self._reading = False
 
-        try:
-            if self.link and self.link.status == RNS.Link.ACTIVE:
-                self.link.teardown()
-        except Exception:
-            pass
+        if self.reader:
+            with suppress(Exception):
+                self.reader.close()
+
+        if self.link and self.link.status == RNS.Link.ACTIVE:
+            self.loop.run_in_executor(None, self._close_link)
+
+        with suppress(OSError):
+            self.tcp_sock.close()
 
         RNS.log(f"Bridged connection closed for {self.addr}", RNS.LOG_INFO)
 
+    def _close_link(self):
+        """Send what is left of the TCP data and EOF, then tear down the link.
+
+        Runs in an executor thread. stop() has already cleared running, so
+        nothing on the event loop touches the queue any more.
+        """
+        if self.writer:
+            deadline = time.monotonic() + LINK_DRAIN_TIMEOUT
+            with suppress(Exception):
+                while self._rnsq and self.link.status == RNS.Link.ACTIVE:
+                    if time.monotonic() >= deadline:
+                        break
+                    sent = self.writer.write(self._rnsq) if self.channel.is_ready_to_send() else 0
+                    if sent:
+                        del self._rnsq[:sent]
+                    else:
+                        time.sleep(WINDOW_RETRY)
+                if self.link.status == RNS.Link.ACTIVE:
+                    self.writer.close()
+
+        with suppress(Exception):
+            self.link.teardown()
+
 
 def main():
     parser = argparse.ArgumentParser(description="RNS IRC Bridge - Client")
@@ -10,13 +10,17 @@ Each IRC client gets its own RNS Link and its own TCP socket to InspIRCd.
 
 import os
 import sys
+import errno
+import struct
 import time
 import signal
 import socket
+import asyncio
 import threading
+import collections
 import argparse
+from contextlib import suppress
 
-import yaml
 import RNS
 
 APP_NAME = "irc"
@@ -26,10 +30,100 @@ DEFAULT_CONFIG = {
     "identity_file": "~/.reticulum/irc_server_identity",
     "irc_host": "127.0.0.1",
     "irc_port": 6667,
+    "irc_socket_path": None,
     "rns_configdir": None,
     "announce_interval": 600,
+    "batch_bytes": 1024,
+    "batch_ms": 10,
+    "max_clients": 64,
 }
 
+# Socket tuning for bulk (DCC) transfers and interactive latency
+RECV_CHUNK = 65536
+SOCK_BUF_SIZE = 1 << 20
+
+# Seconds between retries while the RNS channel window is full
+WINDOW_RETRY = 0.05
+
+# Seconds a closing connection may spend sending queued data over its link
+LINK_DRAIN_TIMEOUT = 15
+
+# Stop reading from RNS while this much is waiting for a slow TCP peer
+TXBUF_HIGH_WATER = 256 * 1024
+
+# MSG_ZEROCOPY (Linux 4.14+) for large RNS->TCP writes; constants from
+# <linux/socket.h> and <linux/errqueue.h> where Python doesn't expose them
+SO_ZEROCOPY = getattr(socket, "SO_ZEROCOPY", 60)
+MSG_ZEROCOPY = getattr(socket, "MSG_ZEROCOPY", 0x4000000)
+SO_EE_ORIGIN_ZEROCOPY = 5
+SO_EE_CODE_ZEROCOPY_COPIED = 1
+_SOCK_EXTENDED_ERR = struct.Struct("=IBBBBII")
+# Below this, page pinning and completion handling cost more than the copy
+ZEROCOPY_MIN_BYTES = 10240
+
+
+def _tune_socket(sock):
+    """Disable Nagle and enlarge kernel buffers on a bridged TCP socket."""
+    if sock.family != socket.AF_UNIX:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF_SIZE)
+
+
+class ZerocopySender:
+    """Sends large payloads with MSG_ZEROCOPY on Linux, falling back to send().
+
+    The kernel pins the pages of a zerocopy send instead of copying them, so
+    each payload is kept alive until its completion is reaped from the
+    socket's error queue.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.enabled = sys.platform.startswith("linux") and sock.family != socket.AF_UNIX
+        if self.enabled:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_ZEROCOPY, 1)
+            except OSError:
+                self.enabled = False
+        self._next_id = 0
+        self._inflight = collections.deque()  # (send id, payload)
+
+    def send(self, data):
+        """Send what the socket will take of data; return the byte count."""
+        if not self.enabled or len(data) < ZEROCOPY_MIN_BYTES:
+            return self.sock.send(data)
+        try:
+            sent = self.sock.sendmsg([data], [], MSG_ZEROCOPY)
+        except OSError as e:
+            if e.errno != errno.ENOBUFS:
+                raise
+            # Out of pinnable memory; copy this one
+            return self.sock.send(data)
+        self._inflight.append((self._next_id, data))
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        return sent
+
+    def reap(self):
+        """Release payloads whose zerocopy sends the kernel has completed."""
+        while self._inflight:
+            try:
+                _, ancdata, _, _ = self.sock.recvmsg(0, 256, socket.MSG_ERRQUEUE)
+            except OSError:
+                return
+            for _, _, cdata in ancdata:
+                if len(cdata) < _SOCK_EXTENDED_ERR.size:
+                    continue
+                _, origin, _, code, _, _, last = _SOCK_EXTENDED_ERR.unpack_from(cdata)
+                if origin != SO_EE_ORIGIN_ZEROCOPY:
+                    continue
+                # Completions cover the id range [first, last]; ids wrap at 2**32
+                while self._inflight and (last - self._inflight[0][0]) & 0xFFFFFFFF < 0x80000000:
+                    self._inflight.popleft()
+                if code & SO_EE_CODE_ZEROCOPY_COPIED:
+                    # The kernel copied anyway (e.g. loopback): pinning only costs us
+                    self.enabled = False
+
 
 class IRCServerBridge:
     def __init__(self, config_path=None):
@@ -40,18 +134,37 @@ class IRCServerBridge:
         self.reticulum = None
         self.identity = None
         self.destination = None
-        self.clients = []  # list of BridgedConnection
-        self.clients_lock = threading.Lock()
+        self.loop = None
+        # Only touched on the event loop thread, so no lock is needed
+        self.clients = {}  # link hash -> BridgedConnection
+        # One slot per link from establishment until it closes
+        self._client_slots = threading.BoundedSemaphore(self.config["max_clients"])
         self.running = False
+        self._announce_task = None
 
     def _load_config(self, path):
-        with open(path, "r") as f:
-            data = yaml.safe_load(f)
+        # Parsers are imported lazily so a TOML config doesn't need PyYAML
+        if path.endswith(".toml"):
+            import tomllib
+
+            with open(path, "rb") as f:
+                data = tomllib.load(f)
+        else:
+            import yaml
+
+            loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+            with open(path, "r") as f:
+                data = yaml.load(f, Loader=loader)
         return data.get("server", {})
 
     def start(self):
         self.running = True
 
+        # One event loop drives every IRC socket and (via
+        # call_soon_threadsafe) every RNS callback
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
         # Initialize Reticulum
         rns_configdir = self.config.get("rns_configdir")
         if rns_configdir:
@@ -83,167 +196,356 @@ class IRCServerBridge:
         dest_hash = RNS.prettyhexrep(self.destination.hash)
         RNS.log(f"IRC Server Bridge running", RNS.LOG_INFO)
         RNS.log(f"Destination hash: {dest_hash}", RNS.LOG_INFO)
-        RNS.log(
-            f"Bridging to IRC at {self.config['irc_host']}:{self.config['irc_port']}",
-            RNS.LOG_INFO,
-        )
+        if self.config.get("irc_socket_path"):
+            irc_address = self.config["irc_socket_path"]
+        else:
+            irc_address = f"{self.config['irc_host']}:{self.config['irc_port']}"
+        RNS.log(f"Bridging to IRC at {irc_address}", RNS.LOG_INFO)
 
-        # Periodic announce thread
+        # Periodic announce task
         announce_interval = self.config.get("announce_interval", 600)
         if announce_interval > 0:
-            announce_thread = threading.Thread(
-                target=self._announce_loop,
-                args=(announce_interval,),
-                daemon=True,
-            )
-            announce_thread.start()
+            self._announce_task = self.loop.create_task(self._announce_loop(announce_interval))
 
-        # Main loop
         try:
-            while self.running:
-                time.sleep(1)
+            self.loop.run_forever()
         except KeyboardInterrupt:
             pass
         finally:
             self.shutdown()
 
-    def _announce_loop(self, interval):
-        while self.running:
-            time.sleep(interval)
-            if self.running and self.destination:
-                self.destination.announce()
-                RNS.log("Sent periodic announce", RNS.LOG_DEBUG)
+    async def _announce_loop(self, interval):
+        # Cancelled by shutdown(), so the sleep never delays exit
+        while True:
+            await asyncio.sleep(interval)
+            self.destination.announce()
+            RNS.log("Sent periodic announce", RNS.LOG_DEBUG)
 
     def _link_established(self, link):
-        RNS.log(f"New RNS Link from {RNS.prettyhexrep(link.hash)}", RNS.LOG_INFO)
+        """Called from an RNS thread; hands off to the event loop."""
         link.set_link_closed_callback(self._link_closed)
+        asyncio.run_coroutine_threadsafe(self._bridge_link(link), self.loop)
+
+    async def _bridge_link(self, link):
+        if not self._client_slots.acquire(blocking=False):
+            RNS.log(
+                f"Rejecting RNS Link {RNS.prettyhexrep(link.hash)}: "
+                f"max_clients ({self.config['max_clients']}) reached",
+                RNS.LOG_WARNING,
+            )
+            link.teardown()
+            return
+
+        RNS.log(f"New RNS Link from {RNS.prettyhexrep(link.hash)}", RNS.LOG_INFO)
 
-        # Connect to the local IRC server
+        # Connect to the local IRC server, over its Unix socket if configured
+        irc_sock = None
         try:
-            irc_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            irc_sock.connect((self.config["irc_host"], self.config["irc_port"]))
-            irc_sock.setblocking(True)
+            socket_path = self.config.get("irc_socket_path")
+            if socket_path:
+                irc_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                address = os.path.expanduser(socket_path)
+            else:
+                irc_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                address = (self.config["irc_host"], self.config["irc_port"])
+            _tune_socket(irc_sock)
+            irc_sock.setblocking(False)
+            await self.loop.sock_connect(irc_sock, address)
         except Exception as e:
             RNS.log(f"Failed to connect to IRC server: {e}", RNS.LOG_ERROR)
+            if irc_sock:
+                irc_sock.close()
+            self._client_slots.release()
             link.teardown()
             return
 
-        # Create bidirectional buffer over the link's channel
-        channel = link.get_channel()
-        conn = BridgedConnection(link, irc_sock, channel)
+        if link.status == RNS.Link.CLOSED:
+            # The link went away while we were connecting
+            irc_sock.close()
+            self._client_slots.release()
+            return
+
+        # Nothing awaits this coroutine, so failures past this point must be
+        # cleaned up here or the link would keep its slot with nothing bridged
+        conn = None
+        try:
+            # Create bidirectional buffer over the link's channel
+            channel = link.get_channel()
+            conn = BridgedConnection(
+                link,
+                irc_sock,
+                channel,
+                self.loop,
+                self.config["batch_bytes"],
+                self.config["batch_ms"],
+            )
 
-        with self.clients_lock:
-            self.clients.append(conn)
+            self.clients[link.hash] = conn
+
+            conn.start()
+        except Exception as e:
+            RNS.log(f"Failed to bridge RNS Link {RNS.prettyhexrep(link.hash)}: {e}", RNS.LOG_ERROR)
+            self.clients.pop(link.hash, None)
+            self._client_slots.release()
+            if conn:
+                conn.stop()
+            with suppress(OSError):
+                irc_sock.close()
+            with suppress(Exception):
+                link.teardown()
+            return
 
-        conn.start()
         RNS.log(
             f"Bridged connection established (active clients: {len(self.clients)})",
             RNS.LOG_INFO,
         )
 
     def _link_closed(self, link):
-        RNS.log(f"RNS Link closed: {RNS.prettyhexrep(link.hash)}", RNS.LOG_INFO)
-        with self.clients_lock:
-            for conn in self.clients:
-                if conn.link == link:
-                    conn.stop()
-                    self.clients.remove(conn)
-                    break
+        """Called from an RNS thread; hands off to the event loop."""
+        self.loop.call_soon_threadsafe(self._on_link_closed, link)
+
+    def _on_link_closed(self, link):
+        conn = self.clients.pop(link.hash, None)
+        if conn:
+            self._client_slots.release()
+            RNS.log(f"RNS Link closed: {conn.link_name}", RNS.LOG_INFO)
+            conn.stop()
+        else:
+            RNS.log(f"RNS Link closed: {RNS.prettyhexrep(link.hash)}", RNS.LOG_INFO)
         RNS.log(f"Active clients: {len(self.clients)}", RNS.LOG_INFO)
 
     def shutdown(self):
         RNS.log("Shutting down server bridge...", RNS.LOG_INFO)
         self.running = False
-        with self.clients_lock:
-            for conn in list(self.clients):
-                conn.stop()
-            self.clients.clear()
+        if self._announce_task:
+            self._announce_task.cancel()
+
+        clients = list(self.clients.values())
+        self.clients.clear()
+        for conn in clients:
+            conn.stop()
+
+        if self.loop:
+            self.loop.stop()
 
 
 class BridgedConnection:
-    """Bridges a single RNS Link <-> TCP IRC socket."""
+    """Bridges a single RNS Link <-> TCP IRC socket.
+
+    Everything runs on the bridge's event loop; the RNS buffer callback
+    (_rns_data_ready) only schedules work onto it.
+    """
 
     BUFFER_STREAM_ID = 0
 
-    def __init__(self, link, irc_sock, channel):
+    def __init__(self, link, irc_sock, channel, loop, batch_bytes, batch_ms):
         self.link = link
+        self.link_name = RNS.prettyhexrep(link.hash)
         self.irc_sock = irc_sock
         self.channel = channel
-        self.buffer = None
+        self.loop = loop
+        self.reader = None
+        self.writer = None
         self.running = False
-        self.tcp_to_rns_thread = None
-        self._buffer_lock = threading.Lock()
+        self._rxbuf = bytearray(RECV_CHUNK)
+        self._rxview = memoryview(self._rxbuf)
+        self._txbuf = bytearray()
+        self._rns_ready = 0
+        self._rnsq = bytearray()
+        self._reading = False
+        self._zerocopy = ZerocopySender(irc_sock)
+        self.batch_bytes = batch_bytes
+        self.batch_delay = batch_ms / 1000.0
+        self._flush_handle = None
 
     def start(self):
         self.running = True
 
-        # Create bidirectional RNS buffer
-        self.buffer = RNS.Buffer.create_bidirectional_buffer(
-            self.BUFFER_STREAM_ID,
+        # Create the RNS stream reader and writer
+        self.reader = RNS.Buffer.create_reader(
             self.BUFFER_STREAM_ID,
             self.channel,
             self._rns_data_ready,
         )
+        # Raw writer: the buffered one spins while the channel window is full
+        self.writer = RNS.RawChannelWriter(self.BUFFER_STREAM_ID, self.channel)
 
-        # Start thread to read from TCP and write to RNS
-        self.tcp_to_rns_thread = threading.Thread(
-            target=self._tcp_to_rns_loop, daemon=True
-        )
-        self.tcp_to_rns_thread.start()
+        # Hand the IRC socket to the event loop for TCP->RNS forwarding
+        self.irc_sock.setblocking(False)
+        self._set_reading(True)
 
     def _rns_data_ready(self, ready_bytes):
-        """Called when RNS buffer has data from the remote IRC client."""
+        """Called from an RNS thread when the buffer has data from the remote IRC client."""
+        self.loop.call_soon_threadsafe(self._forward_to_tcp, ready_bytes)
+
+    def _forward_to_tcp(self, ready_bytes):
         if not self.running:
             return
+        if len(self._txbuf) >= TXBUF_HIGH_WATER:
+            # The TCP peer isn't keeping up: leave the data in the RNS
+            # reader until _on_tcp_writable has drained _txbuf
+            self._rns_ready = ready_bytes
+            return
         try:
-            with self._buffer_lock:
-                data = self.buffer.read(ready_bytes)
+            data = self.reader.read(ready_bytes)
             if data:
-                self.irc_sock.sendall(data)
+                self._send(data)
         except Exception as e:
             RNS.log(f"Error forwarding RNS->TCP: {e}", RNS.LOG_ERROR)
             self.stop()
 
-    def _tcp_to_rns_loop(self):
-        """Read from IRC TCP socket and write to RNS buffer."""
+    def _send(self, data):
+        """Write to the IRC socket, queueing whatever it can't take yet."""
+        if self._txbuf:
+            self._txbuf += data
+            return
+        self._zerocopy.reap()
         try:
-            while self.running:
-                data = self.irc_sock.recv(4096)
-                if not data:
-                    RNS.log("IRC server closed connection", RNS.LOG_INFO)
+            sent = self._zerocopy.send(data)
+        except BlockingIOError:
+            sent = 0
+        if sent < len(data):
+            self._txbuf += memoryview(data)[sent:]
+            self.loop.add_writer(self.irc_sock, self._on_tcp_writable)
+
+    def _on_tcp_writable(self):
+        self._zerocopy.reap()
+        try:
+            sent = self.irc_sock.send(self._txbuf)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            RNS.log(f"Error forwarding RNS->TCP: {e}", RNS.LOG_ERROR)
+            self.stop()
+            return
+        del self._txbuf[:sent]
+        if not self._txbuf:
+            self.loop.remove_writer(self.irc_sock)
+            if self._rns_ready:
+                ready_bytes, self._rns_ready = self._rns_ready, 0
+                self._forward_to_tcp(ready_bytes)
+
+    def _set_reading(self, reading):
+        """Start or stop polling the TCP socket for TCP->RNS data."""
+        if reading == self._reading:
+            return
+        self._reading = reading
+        if reading:
+            self.loop.add_reader(self.irc_sock, self._on_tcp_readable)
+        else:
+            self.loop.remove_reader(self.irc_sock)
+
+    def _write(self, data):
+        """Queue TCP data for the RNS Link, flushing once a batch is full."""
+        self._rnsq += data
+        if len(self._rnsq) >= self.batch_bytes or self.batch_delay <= 0:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.batch_delay, self.flush)
+
+    def flush(self):
+        """Send queued TCP data over the RNS Link, as far as the channel window allows.
+
+        RNS returns 0 from a write while the window is full rather than
+        blocking, so packets are only handed over while the channel is
+        ready. The rest stays queued with the TCP reader paused, so
+        backpressure reaches the sender, and is retried shortly.
+        """
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self.running:
+            return
+        try:
+            while self._rnsq and self.channel.is_ready_to_send():
+                sent = self.writer.write(self._rnsq)
+                if not sent:
                     break
-                with self._buffer_lock:
-                    self.buffer.write(data)
-                    self.buffer.flush()
+                del self._rnsq[:sent]
         except Exception as e:
-            if self.running:
-                RNS.log(f"Error in TCP->RNS loop: {e}", RNS.LOG_ERROR)
-        finally:
+            RNS.log(f"Error in TCP->RNS forwarding: {e}", RNS.LOG_ERROR)
             self.stop()
+            return
+        if self._rnsq:
+            self._set_reading(False)
+            self._flush_handle = self.loop.call_later(WINDOW_RETRY, self.flush)
+        else:
+            self._set_reading(True)
+
+    def _on_tcp_readable(self):
+        """Read once from the IRC TCP socket and queue it for the RNS Link."""
+        if not self.running:
+            return
+        # Zerocopy completions raise POLLERR, which also wakes this callback
+        self._zerocopy.reap()
+        try:
+            # One read per wakeup: flush() only hands RNS what its window
+            # will take, so anything more is better left in the kernel
+            # socket buffer, where it pushes back on the sender.
+            try:
+                n = self.irc_sock.recv_into(self._rxview)
+            except BlockingIOError:
+                return
+            if n:
+                self._write(self._rxview[:n])
+                return
+            RNS.log("IRC server closed connection", RNS.LOG_INFO)
+        except Exception as e:
+            if self.running:
+                RNS.log(f"Error in TCP->RNS forwarding: {e}", RNS.LOG_ERROR)
+        self.stop()
 
     def stop(self):
         if not self.running:
             return
         self.running = False
 
-        try:
-            self.irc_sock.close()
-        except Exception:
-            pass
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
 
-        try:
-            if self.buffer:
-                self.buffer.close()
-        except Exception:
-            pass
+        # Stop polling first, then hand the link to an executor thread:
+        # sending the queued data and EOF waits on the channel window,
+        # which would stall every other connection on the event loop.
+        with suppress(ValueError):
+            self.loop.remove_reader(self.irc_sock)
+            self.loop.remove_writer(self.irc_sock)
+        self._reading = False
 
-        try:
-            if self.link and self.link.status == RNS.Link.ACTIVE:
-                self.link.teardown()
-        except Exception:
-            pass
+        if self.reader:
+            with suppress(Exception):
+                self.reader.close()
+
+        if self.link and self.link.status == RNS.Link.ACTIVE:
+            self.loop.run_in_executor(None, self._close_link)
+
+        with suppress(OSError):
+            self.irc_sock.close()
 
-        RNS.log("Bridged connection closed", RNS.LOG_INFO)
+        RNS.log(f"Bridged connection closed for {self.link_name}", RNS.LOG_INFO)
+
+    def _close_link(self):
+        """Send what is left of the TCP data and EOF, then tear down the link.
+
+        Runs in an executor thread. stop() has already cleared running, so
+        nothing on the event loop touches the queue any more.
+        """
+        if self.writer:
+            deadline = time.monotonic() + LINK_DRAIN_TIMEOUT
+            with suppress(Exception):
+                while self._rnsq and self.link.status == RNS.Link.ACTIVE:
+                    if time.monotonic() >= deadline:
+                        break
+                    sent = self.writer.write(self._rnsq) if self.channel.is_ready_to_send() else 0
+                    if sent:
+                        del self._rnsq[:sent]
+                    else:
+                        time.sleep(WINDOW_RETRY)
+                if self.link.status == RNS.Link.ACTIVE:
+                    self.writer.close()
+
+        with suppress(Exception):
+            self.link.teardown()
 
 
 def main():